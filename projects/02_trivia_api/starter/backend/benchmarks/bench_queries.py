@@ -0,0 +1,111 @@
+'''
+Microbenchmark of the hot queries, built per request or baked.
+
+From the backend folder:
+    python benchmarks/bench_queries.py
+    python benchmarks/bench_queries.py --database postgres://localhost:5432/trivia_bench
+
+The default database is a temporary SQLite file: its queries run so
+fast that the times mostly measure the Python work of building,
+compiling and loading each query. The database given with --database
+is seeded, so do not point it to a database you want to keep.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import func
+
+import queries
+from models import setup_db, db, Question, Category
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment',
+              'Sports']
+
+
+def seed(size):
+    db.session.query(Question).delete()
+    db.session.query(Category).delete()
+    db.session.execute(Category.__table__.insert(), [
+        {'id': category_id, 'type': category_type}
+        for category_id, category_type in enumerate(CATEGORIES, 1)])
+    db.session.execute(Question.__table__.insert(), [
+        {'id': question_id,
+         'question': 'Question {} about a title?'.format(question_id),
+         'answer': 'Answer {}'.format(question_id),
+         'category': question_id % len(CATEGORIES) + 1,
+         'difficulty': question_id % 5 + 1,
+         'version': question_id}
+        for question_id in range(1, size + 1)])
+    db.session.commit()
+
+
+'''
+the queries as the routes built them before the queries module
+'''
+BEFORE = {
+    'question_by_id': lambda: Question.query.
+    filter(Question.id == 7).one_or_none(),
+    'questions_by_category': lambda: Question.query.order_by(Question.id).
+    filter(Question.category == str(4)).all(),
+    'search_questions': lambda: Question.query.order_by(Question.id).
+    filter(Question.question.ilike('%{}%'.format('7 about'))).all(),
+    'draw_questions': lambda: Question.query.
+    filter(~Question.id.in_([4, 10])).filter(Question.category == 4).
+    order_by(func.random()).limit(5).all(),
+    'all_categories': lambda: Category.query.order_by(Category.id).all(),
+}
+
+AFTER = {
+    'question_by_id': lambda: queries.question_by_id(7),
+    'questions_by_category': lambda: queries.questions_by_category(4),
+    'search_questions': lambda: queries.search_questions('7 about'),
+    'draw_questions': lambda: queries.draw_questions(4, [4, 10], 5),
+    'all_categories': lambda: queries.all_categories(),
+}
+
+
+def time_per_call(function, iterations):
+    function()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+        # a new session per call, as for a request.
+        db.session.remove()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--database', default=None)
+    parser.add_argument('--size', type=int, default=60)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    database_file = None
+    database_path = args.database
+    if database_path is None:
+        database_file = tempfile.NamedTemporaryFile(suffix='.db')
+        database_path = 'sqlite:///' + database_file.name
+
+    app = Flask(__name__)
+    with app.app_context():
+        setup_db(app, database_path)
+        seed(args.size)
+
+        print('{:<24}{:>12}{:>12}{:>9}'.format('query', 'before (us)',
+                                               'after (us)', 'saved'))
+        for name in BEFORE:
+            before = time_per_call(BEFORE[name], args.iterations)
+            after = time_per_call(AFTER[name], args.iterations)
+            print('{:<24}{:>12.0f}{:>12.0f}{:>8.0f}%'.format(
+                name, before, after, (before - after) / before * 100))
+
+
+if __name__ == '__main__':
+    main()
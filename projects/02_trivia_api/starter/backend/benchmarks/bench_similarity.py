@@ -0,0 +1,106 @@
+'''
+Benchmark of the near-duplicate index on a synthetic question bank.
+
+From the backend folder:
+    python benchmarks/bench_similarity.py --size 1000000
+
+Prints the time to build the index, the cost of one lookup and of one
+insert, the memory used and the share of the injected near-duplicates
+that are found.
+'''
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity import SimilarityIndex, DUPLICATE_THRESHOLD, jaccard, \
+    shingles
+
+
+def synthetic_questions(size, duplicate_rate, seed):
+    generator = random.Random(seed)
+    vocabulary = ['word{}'.format(i) for i in range(50000)]
+    questions = []
+    duplicates = []
+    for question_id in range(1, size + 1):
+        if questions and generator.random() < duplicate_rate:
+            # near-duplicate: same question with one word changed.
+            original_id = generator.randrange(1, len(questions) + 1)
+            words, answer = questions[original_id - 1]
+            words = list(words)
+            words[generator.randrange(len(words))] = \
+                generator.choice(vocabulary)
+            duplicates.append((original_id, question_id))
+        else:
+            words = [generator.choice(vocabulary)
+                     for _ in range(generator.randint(8, 16))]
+            answer = generator.choice(vocabulary)
+        questions.append((words, answer))
+    return [(' '.join(words) + '?', answer) for words, answer in questions], \
+        duplicates
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    questions, duplicates = synthetic_questions(args.size,
+                                                args.duplicate_rate,
+                                                args.seed)
+    print('generated {} questions ({} near-duplicates) in {:.1f}s'.format(
+        len(questions), len(duplicates), time.perf_counter() - start))
+    rss_before = max_rss_mb()
+
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    for question_id, (question, answer) in enumerate(questions, 1):
+        index.add(question_id, question, answer)
+    elapsed = time.perf_counter() - start
+    print('built index in {:.1f}s ({:.1f}us per question), '
+          '~{:.0f}MB'.format(elapsed, elapsed / len(questions) * 1e6,
+                             max_rss_mb() - rss_before))
+
+    generator = random.Random(args.seed)
+    probes = [generator.randrange(len(questions))
+              for _ in range(args.lookups)]
+    start = time.perf_counter()
+    candidates = 0
+    for position in probes:
+        candidates += len(index.candidates(*questions[position]))
+    elapsed = time.perf_counter() - start
+    print('lookup: {:.1f}us, {:.2f} candidates on average'.format(
+        elapsed / len(probes) * 1e6, candidates / len(probes)))
+
+    start = time.perf_counter()
+    for offset, position in enumerate(probes):
+        index.add(len(questions) + offset + 1, *questions[position])
+    elapsed = time.perf_counter() - start
+    print('insert: {:.1f}us'.format(elapsed / len(probes) * 1e6))
+    for offset in range(len(probes)):
+        index.remove(len(questions) + offset + 1)
+
+    expected = [(first, second) for first, second in duplicates
+                if jaccard(shingles(*questions[first - 1]),
+                           shingles(*questions[second - 1])) >=
+                DUPLICATE_THRESHOLD]
+    found = sum(1 for first, second in expected
+                if first in index.candidates(*questions[second - 1]))
+    print('recall: {}/{} near-duplicates above {} similarity'.format(
+        found, len(expected), DUPLICATE_THRESHOLD))
+
+
+if __name__ == '__main__':
+    main()
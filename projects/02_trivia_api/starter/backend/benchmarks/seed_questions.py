@@ -0,0 +1,116 @@
+'''
+Adds synthetic questions to a Postgres trivia database, then times a
+category query, to try the bank at a large size.
+
+From the backend folder:
+    python benchmarks/seed_questions.py --size 1000000 --database postgres://localhost:5432/trivia_bench
+
+Questions are spread evenly over the existing categories and loaded
+with COPY. The category_stats table is rebuilt afterwards.
+'''
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models import setup_db, db, database_path, CategoryStat, \
+    QUESTION_VERSION_LOCK
+
+COPY_CHUNK = 100000
+
+
+def synthetic_rows(first_id, first_version, size, categories, seed):
+    generator = random.Random(seed)
+    for offset in range(size):
+        yield '{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+            first_id + offset,
+            'Synthetic question {} number {}?'.format(
+                generator.randrange(10 ** 6), first_id + offset),
+            'Answer {}'.format(generator.randrange(10 ** 6)),
+            generator.randint(1, 5),
+            categories[offset % len(categories)],
+            first_version + offset)
+
+
+def copy_questions(size, seed):
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SELECT id FROM categories ORDER BY id')
+        categories = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT coalesce(max(id), 0) + 1 FROM questions')
+        first_id = cursor.fetchone()[0]
+        # versions are drawn and committed under the lock of the
+        # application writes.
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)',
+                       (QUESTION_VERSION_LOCK,))
+        cursor.execute("SELECT nextval('question_version_seq')")
+        first_version = cursor.fetchone()[0]
+
+        rows = synthetic_rows(first_id, first_version, size, categories,
+                              seed)
+        for start in range(0, size, COPY_CHUNK):
+            chunk = io.StringIO(''.join(
+                next(rows) for _ in range(min(COPY_CHUNK, size - start))))
+            cursor.copy_expert(
+                'COPY questions (id, question, answer, difficulty, '
+                'category, version) FROM STDIN', chunk)
+
+        cursor.execute("SELECT setval('questions_id_seq', %s)",
+                       (first_id + size - 1,))
+        cursor.execute("SELECT setval('question_version_seq', %s)",
+                       (first_version + size - 1,))
+        connection.commit()
+        cursor.execute('ANALYZE questions')
+        connection.commit()
+        return categories
+    finally:
+        connection.close()
+
+
+def explain_category_query(category_id):
+    plan = db.engine.execute(
+        'EXPLAIN (ANALYZE, FORMAT JSON) '
+        'SELECT * FROM questions WHERE category = %s ORDER BY id',
+        (category_id,)).scalar()[0]
+    tables = set()
+    nodes = [plan['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if 'Relation Name' in node:
+            tables.add(node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+    return plan['Execution Time'], sorted(tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--database', default=database_path)
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    with app.app_context():
+        setup_db(app, args.database)
+
+        start = time.perf_counter()
+        categories = copy_questions(args.size, args.seed)
+        CategoryStat.rebuild()
+        print('added {} questions in {:.1f}s'.format(
+            args.size, time.perf_counter() - start))
+
+        execution_time, tables = explain_category_query(categories[0])
+        print('category {} query: {:.1f}ms, reads {}'.format(
+            categories[0], execution_time, json.dumps(tables)))
+
+
+if __name__ == '__main__':
+    main()
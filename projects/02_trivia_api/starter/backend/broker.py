@@ -0,0 +1,239 @@
+import contextlib
+import json
+import queue
+import threading
+import time
+import uuid
+
+ROOM_TTL_SECONDS = 24 * 60 * 60
+ROOM_LOCK_SECONDS = 10
+ROOM_SWEEP_SECONDS = 60
+
+
+class BrokerLockTimeout(Exception):
+    pass
+
+
+'''
+create_broker(url)
+    returns the publish/subscribe broker used by live quiz rooms.
+    'memory://' keeps rooms inside the current process.
+    'redis://host:port/db' shares them between workers through any
+    Redis-compatible server (needs the optional redis package).
+'''
+def create_broker(url='memory://'):
+    if url.startswith('memory://'):
+        return InProcessBroker()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(url)
+    raise ValueError('unsupported broker url: {}'.format(url))
+
+
+'''
+InProcessBroker
+    every subscriber gets its own queue; publish copies the message
+    to each queue of the channel. Room state and answers expire
+    ttl_seconds after their last write, as they do in Redis.
+'''
+class InProcessBroker:
+
+    def __init__(self, ttl_seconds=ROOM_TTL_SECONDS):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._states = {}
+        self._answers = {}
+        self._key_locks = {}
+        self._ttl_seconds = ttl_seconds
+        self._expiries = {}
+        self._next_sweep = time.monotonic() + \
+            min(ttl_seconds, ROOM_SWEEP_SECONDS)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.put(message)
+        return len(subscribers)
+
+    def subscribe(self, channel):
+        subscription = InProcessSubscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.channel, None)
+
+    @contextlib.contextmanager
+    def lock(self, key, timeout=ROOM_LOCK_SECONDS):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        if not key_lock.acquire(timeout=timeout):
+            raise BrokerLockTimeout(key)
+        try:
+            yield
+        finally:
+            key_lock.release()
+
+    def _touch(self, key):
+        # called with self._lock held: pushes back the expiry of key,
+        # and now and then drops every expired key.
+        now = time.monotonic()
+        self._expiries[key] = now + self._ttl_seconds
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + min(self._ttl_seconds, ROOM_SWEEP_SECONDS)
+        for expired in [other for other, expiry in self._expiries.items()
+                        if expiry <= now]:
+            del self._expiries[expired]
+            self._states.pop(expired, None)
+            self._answers.pop(expired, None)
+            self._key_locks.pop(expired, None)
+
+    def _is_expired(self, key):
+        return self._expiries.get(key, 0) <= time.monotonic()
+
+    def get_state(self, key):
+        with self._lock:
+            state = None if self._is_expired(key) else self._states.get(key)
+        return None if state is None else json.loads(state)
+
+    def set_state(self, key, state):
+        # stored serialized, like in Redis, so callers never share
+        # mutable state between threads.
+        with self._lock:
+            self._states[key] = json.dumps(state)
+            self._touch(key)
+
+    def push_answers(self, key, answers):
+        with self._lock:
+            self._answers.setdefault(key, []).extend(answers)
+            self._touch(key)
+
+    def pop_answers(self, key):
+        with self._lock:
+            return self._answers.pop(key, [])
+
+
+class InProcessSubscription:
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue()
+
+    def put(self, message):
+        self._queue.put(message)
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+'''
+RedisBroker
+    same interface as InProcessBroker, backed by Redis pub/sub for
+    messages, plain keys for room state, lists for answers and
+    SET NX keys for locks, which need no Lua scripting.
+'''
+class RedisBroker:
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('the redis package is required '
+                               'to use a {} broker'.format(url))
+        self._redis = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def publish(self, channel, message):
+        return self._redis.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        return RedisSubscription(pubsub)
+
+    @contextlib.contextmanager
+    def lock(self, key, timeout=ROOM_LOCK_SECONDS):
+        name = 'lock:' + key
+        token = uuid.uuid4().hex.encode()
+        deadline = time.monotonic() + timeout
+        # the lock expires by itself if the worker holding it dies.
+        while not self._redis.set(name, token, nx=True,
+                                  px=int(timeout * 1000)):
+            if time.monotonic() >= deadline:
+                raise BrokerLockTimeout(key)
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            self._release(name, token)
+
+    def _release(self, name, token):
+        # only deletes the lock if it is still ours: it may have
+        # expired and been taken by another worker meanwhile.
+        with self._redis.pipeline() as pipeline:
+            try:
+                pipeline.watch(name)
+                if pipeline.get(name) == token:
+                    pipeline.multi()
+                    pipeline.delete(name)
+                    pipeline.execute()
+            except self._watch_error:
+                pass
+
+    def get_state(self, key):
+        state = self._redis.get('state:' + key)
+        return None if state is None else json.loads(state)
+
+    def set_state(self, key, state):
+        self._redis.set('state:' + key, json.dumps(state),
+                        ex=ROOM_TTL_SECONDS)
+
+    def push_answers(self, key, answers):
+        if answers:
+            pipeline = self._redis.pipeline()
+            pipeline.rpush('answers:' + key,
+                           *[json.dumps(answer) for answer in answers])
+            pipeline.expire('answers:' + key, ROOM_TTL_SECONDS)
+            pipeline.execute()
+
+    def pop_answers(self, key):
+        pipeline = self._redis.pipeline()
+        pipeline.lrange('answers:' + key, 0, -1)
+        pipeline.delete('answers:' + key)
+        answers, _ = pipeline.execute()
+        return [json.loads(answer) for answer in answers]
+
+
+class RedisSubscription:
+
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout=None):
+        # get_message also returns None for the subscribe
+        # confirmations it skips, so wait until the deadline.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None \
+                else max(deadline - time.monotonic(), 0)
+            message = self._pubsub.get_message(timeout=remaining)
+            if message is not None:
+                return json.loads(message['data'])
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def close(self):
+        self._pubsub.close()
@@ -1,18 +1,67 @@
 import os
-from flask import Flask, request, abort, jsonify
+import hmac
+import json
+import re
+import threading
+import time
+import uuid
+import click
+from flask import Flask, Response, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
+from models import setup_db, db, database_path, Question, CategoryStat
+from broker import create_broker, BrokerLockTimeout
+import queries
+from snapshot import SnapshotStore, export_snapshot
+from similarity import SimilarityIndex, DUPLICATE_THRESHOLD, \
+    group_duplicates, jaccard, shingles
 
 QUESTIONS_PER_PAGE = 10
+MAX_QUESTION_IDS = 100
+MAX_BATCH_REQUESTS = 20
+MAX_ANSWERS_PER_BATCH = 500
+ROOM_HEARTBEAT_SECONDS = 15
+SIMILARITY_LOAD_CHUNK = 10000
+SIMILARITY_INDEX_WAIT_SECONDS = 2
+SIMILARITY_RETRY_SECONDS = 5
+CHANGES_PER_PAGE = 100
+MAX_QUIZ_COUNT = 50
+MAX_CHANGES_PER_PAGE = 1000
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    # read routes go through a store: the database (queries.py), or,
+    # in read-only mode, a snapshot file exported from it.
+    snapshot_path = app.config.get(
+        'QUESTION_BANK_SNAPSHOT', os.getenv('QUESTION_BANK_SNAPSHOT'))
+    if snapshot_path:
+        store = SnapshotStore(snapshot_path)
+    else:
+        store = queries
+        setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI',
+                                     database_path))
+
+        @app.cli.command('export-snapshot')
+        @click.argument('path')
+        def export_snapshot_command(path):
+            '''Export the question bank to a snapshot file.'''
+            click.echo('exported {} questions to {}'.format(
+                export_snapshot(path), path))
+
+    def require_database():
+        # writes, and reads that need the database, are unavailable
+        # while serving from a snapshot.
+        if snapshot_path:
+            abort(503)
+
+    broker = create_broker(app.config.get(
+        'QUIZ_BROKER_URL', os.getenv('QUIZ_BROKER_URL', 'memory://')))
 
     '''
     @TODO: Set up CORS. Allow '*' for origins.
@@ -41,7 +90,7 @@ def create_app(test_config=None):
     def get_categories():
 
         try:
-            categories = Category.query.order_by(Category.id).all()
+            categories = store.all_categories()
         except Exception as e:
             print(e)
             abort(422)
@@ -55,10 +104,61 @@ def create_app(test_config=None):
             for cat in list_categories:
                 dict_categories[cat["id"]] = cat["type"]
 
-        return jsonify({
+        response = {
             'success': True,
             'categories': dict_categories,
             'number_categories': len(list_categories)
+        }
+
+        # counts are read from the category_stats summary table, or
+        # from the snapshot, so embedding them costs one small query.
+        if request.args.get('with_counts', 'false').lower() == 'true':
+            try:
+                counts = store.question_counts()
+            except Exception as e:
+                print(e)
+                abort(422)
+            response['question_counts'] = {
+                cat['id']: counts.get(cat['id'], 0)
+                for cat in list_categories
+            }
+
+        return jsonify(response)
+
+    '''
+    Per-category statistics served from the category_stats table,
+    which Question.insert/delete keep up to date.
+    '''
+
+    def build_category_stats():
+        rows = CategoryStat.query. \
+               filter(CategoryStat.count > 0). \
+               order_by(CategoryStat.category, CategoryStat.difficulty). \
+               all()
+
+        stats = {}
+        for row in rows:
+            cat = stats.setdefault(row.category,
+                                   {'total': 0, 'difficulties': {}})
+            cat['total'] += row.count
+            cat['difficulties'][row.difficulty] = row.count
+
+        return stats
+
+    @app.route('/categories/stats')
+    def get_category_stats():
+        require_database()
+
+        try:
+            stats = build_category_stats()
+        except Exception as e:
+            print(e)
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'stats': stats,
+            'total_questions': sum(cat['total'] for cat in stats.values())
         })
 
     '''
@@ -75,27 +175,61 @@ def create_app(test_config=None):
     Clicking on the page numbers should update the questions.
     '''
 
-    def paginate_questions(request, selection):
-        page = request.args.get('page', 1, type=int)
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
+    def parse_question_ids(raw_ids):
+        try:
+            ids = [int(question_id) for question_id in raw_ids.split(',')
+                   if question_id.strip()]
+        except ValueError:
+            abort(400)
+
+        if not ids or len(ids) > MAX_QUESTION_IDS:
+            abort(400)
 
-        list_questions = [question.format() for question in selection]
-        current_list = list_questions[start:end]
+        return ids
 
-        return current_list
+    def get_questions_by_ids(ids):
+        # a single IN query, whatever the number of ids requested.
+        try:
+            questions = store.questions_by_ids(ids)
+        except Exception as e:
+            print(e)
+            abort(422)
+
+        if len(questions) == 0:
+            abort(404)
+
+        found_ids = set(question.id for question in questions)
+
+        return jsonify({
+            'success': True,
+            'questions': [question.format() for question in questions],
+            'total_questions': len(questions),
+            'missing': [question_id for question_id in ids
+                        if question_id not in found_ids]
+        })
 
     @app.route('/questions')
     def get_questions():
 
+        raw_ids = request.args.get('ids', None)
+        if raw_ids is not None:
+            return get_questions_by_ids(parse_question_ids(raw_ids))
+
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            abort(404)
+
+        # only the requested page is loaded; the total is counted.
         try:
-            questions = Question.query.order_by(Question.id).all()
-            categories = Category.query.order_by(Category.id).all()
+            questions = store.questions_page(page, QUESTIONS_PER_PAGE)
+            total_questions = store.count_questions()
+            categories = store.all_categories()
         except Exception as e:
             print(e)
             abort(422)
 
-        current_list_questions = paginate_questions(request, questions)
+        current_list_questions = [question.format()
+                                  for question in questions]
         list_categories = [category.format() for category in categories]
 
         if len(current_list_questions) == 0:
@@ -108,12 +242,148 @@ def create_app(test_config=None):
         return jsonify({
             'success': True,
             'questions': current_list_questions,
-            'page': request.args.get('page', 1, type=int),
-            'total_questions': len(questions),
+            'page': page,
+            'total_questions': total_questions,
             'categories': dict_categories,
             'current_category': None
         })
 
+    '''
+    Change feed: questions created or updated, and tombstones of
+    questions deleted, after a given version. Clients keep the
+    next_since value of the last page and only fetch what changed.
+    '''
+
+    @app.route('/questions/changes')
+    def get_question_changes():
+        require_database()
+
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', CHANGES_PER_PAGE, type=int)
+
+        if since < 0 or not 0 < limit <= MAX_CHANGES_PER_PAGE:
+            abort(400)
+
+        try:
+            changes, has_more = queries.question_changes(since, limit)
+        except Exception as e:
+            print(e)
+            abort(422)
+
+        changes = [{'version': change.version,
+                    'type': 'upsert',
+                    'question': change.format()}
+                   if isinstance(change, Question) else
+                   {'version': change.version,
+                    'type': 'delete',
+                    'id': change.question_id}
+                   for change in changes]
+
+        return jsonify({
+            'success': True,
+            'changes': changes,
+            'since': since,
+            'next_since': changes[-1]['version'] if changes else since,
+            'has_more': has_more
+        })
+
+    '''
+    Near-duplicate detection.
+    Each process keeps a similarity index of the questions. It is built
+    in the background after the first request, then brought up to date
+    from the change feed before each use, so it also sees the questions
+    written by other processes.
+    '''
+    similarity_index = SimilarityIndex()
+    similarity_index_lock = threading.Lock()
+    similarity_index_state = {'version': 0}
+    similarity_index_ready = threading.Event()
+
+    def sync_similarity_index():
+        with similarity_index_lock:
+            has_more = True
+            while has_more:
+                changes, has_more = queries.question_changes(
+                    similarity_index_state['version'], SIMILARITY_LOAD_CHUNK)
+                for change in changes:
+                    if isinstance(change, Question):
+                        similarity_index.add(change.id, change.question,
+                                             change.answer)
+                    else:
+                        similarity_index.remove(change.question_id)
+                    similarity_index_state['version'] = change.version
+                    # large catch-ups do not pile up in the session.
+                    db.session.expunge(change)
+        return similarity_index
+
+    def build_similarity_index():
+        with app.app_context():
+            while True:
+                try:
+                    sync_similarity_index()
+                    similarity_index_ready.set()
+                    return
+                except Exception as e:
+                    print(e)
+                    time.sleep(SIMILARITY_RETRY_SECONDS)
+                finally:
+                    db.session.remove()
+
+    if not snapshot_path:
+        @app.before_first_request
+        def start_similarity_index():
+            threading.Thread(target=build_similarity_index,
+                             daemon=True).start()
+
+    def get_similarity_index():
+        # None while the index is being built: requests do not
+        # wait for a large bank to be loaded.
+        if not similarity_index_ready.wait(SIMILARITY_INDEX_WAIT_SECONDS):
+            return None
+        return sync_similarity_index()
+
+    def load_shingles(question_ids):
+        question_ids = list(question_ids)
+        texts = {}
+        for start in range(0, len(question_ids), SIMILARITY_LOAD_CHUNK):
+            rows = Question.query. \
+                   with_entities(Question.id, Question.question,
+                                 Question.answer). \
+                   filter(Question.id.in_(
+                       question_ids[start:start + SIMILARITY_LOAD_CHUNK])). \
+                   all()
+            for row in rows:
+                texts[row.id] = shingles(row.question, row.answer)
+        return texts
+
+    def find_duplicates(question, answer):
+        index = get_similarity_index()
+        if index is None:
+            return None
+
+        candidate_ids = index.candidates(question, answer)
+        if not candidate_ids:
+            return []
+
+        new_shingles = shingles(question, answer)
+        duplicates = []
+        for question_id, candidate in load_shingles(candidate_ids).items():
+            similarity = jaccard(new_shingles, candidate)
+            if similarity >= DUPLICATE_THRESHOLD:
+                duplicates.append({'id': question_id,
+                                   'similarity': round(similarity, 2)})
+
+        return sorted(duplicates,
+                      key=lambda duplicate: (-duplicate['similarity'],
+                                             duplicate['id']))
+
+    def similarity_index_not_ready():
+        return jsonify({
+            'success': False,
+            'error': 503,
+            'message': 'duplicate detection is starting, retry later'
+        }), 503
+
     '''
     @TODO:
     Create an endpoint to DELETE question using a question ID.
@@ -125,11 +395,10 @@ def create_app(test_config=None):
 
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
+        require_database()
 
         try:
-            question_to_delete = Question.query. \
-                                 filter(Question.id == question_id). \
-                                 one_or_none()
+            question_to_delete = store.question_by_id(question_id)
         except Exception as e:
             print(e)
             abort(422)
@@ -142,7 +411,7 @@ def create_app(test_config=None):
         return jsonify({
             'success': True,
             'deleted': question_id,
-            'total_number_questions': len(Question.query.all())
+            'total_number_questions': store.count_questions()
         })
 
     '''
@@ -159,6 +428,7 @@ def create_app(test_config=None):
 
     @app.route('/questions', methods=['POST'])
     def add_question():
+        require_database()
         body = request.get_json()
 
         if body is None:
@@ -171,6 +441,23 @@ def create_app(test_config=None):
 
         if all(v is not None for v in
                [new_question, new_answer, new_category, new_difficulty]):
+            try:
+                duplicates = find_duplicates(new_question, new_answer)
+            except Exception as e:
+                print(e)
+                abort(422)
+
+            if duplicates is None and body.get('reject_duplicates', False):
+                return similarity_index_not_ready()
+
+            if duplicates and body.get('reject_duplicates', False):
+                return jsonify({
+                    'success': False,
+                    'error': 409,
+                    'message': 'duplicate question',
+                    'duplicates': duplicates
+                }), 409
+
             try:
                 question_to_add = Question(question=new_question,
                                            answer=new_answer,
@@ -180,7 +467,8 @@ def create_app(test_config=None):
                 return jsonify({
                     'success': True,
                     'created': question_to_add.id,
-                    'total_number_questions': len(Question.query.all())
+                    'total_number_questions': store.count_questions(),
+                    'possible_duplicates': duplicates
                 })
             except Exception as e:
                 print(e)
@@ -188,6 +476,59 @@ def create_app(test_config=None):
         else:
             abort(422)
 
+    '''
+    Report of the groups of near-duplicate questions in the bank,
+    ten groups per page.
+    '''
+
+    @app.route('/questions/duplicates')
+    def get_duplicate_questions():
+        require_database()
+        page = request.args.get('page', 1, type=int)
+
+        try:
+            index = get_similarity_index()
+            if index is None:
+                return similarity_index_not_ready()
+            pairs = index.candidate_pairs()
+            texts = load_shingles(set(question_id for pair in pairs
+                                      for question_id in pair))
+            groups = group_duplicates(
+                (first, second) for first, second in pairs
+                if first in texts and second in texts and
+                jaccard(texts[first], texts[second]) >= DUPLICATE_THRESHOLD)
+        except Exception as e:
+            print(e)
+            abort(422)
+
+        start = (page - 1) * QUESTIONS_PER_PAGE
+        current_groups = groups[start:start + QUESTIONS_PER_PAGE]
+
+        if len(current_groups) == 0:
+            abort(404)
+
+        try:
+            questions = Question.query. \
+                        filter(Question.id.in_([question_id
+                                                for group in current_groups
+                                                for question_id in group])). \
+                        all()
+        except Exception as e:
+            print(e)
+            abort(422)
+
+        questions = {question.id: question.format()
+                     for question in questions}
+
+        return jsonify({
+            'success': True,
+            'groups': [[questions[question_id] for question_id in group
+                        if question_id in questions]
+                       for group in current_groups],
+            'page': page,
+            'total_groups': len(groups)
+        })
+
     '''
     @TODO:
     Create a POST endpoint to get questions based on a search term.
@@ -210,9 +551,7 @@ def create_app(test_config=None):
 
         if search_terms:
             try:
-                list_questions = Question.query.order_by(Question.id). \
-                                 filter(Question.question.
-                                        ilike(f'%{search_terms}%'))
+                list_questions = store.search_questions(search_terms)
             except Exception as e:
                 print(e)
                 abort(422)
@@ -225,7 +564,7 @@ def create_app(test_config=None):
                     'success': True,
                     'search_terms': search_terms,
                     'questions': formatted_list_questions,
-                    'total_questions': list_questions.count(),
+                    'total_questions': len(formatted_list_questions),
                     'current_category': None
                 })
             else:
@@ -248,9 +587,7 @@ def create_app(test_config=None):
         # models.py is only what the python application can see and know.
         # foreign key is defined in trivia.psql
         try:
-            list_questions = Question.query.order_by(Question.id). \
-                             filter(Question.category == str(category_id)). \
-                             all()
+            list_questions = store.questions_by_category(category_id)
         except Exception as e:
             print(e)
             abort(422)
@@ -288,48 +625,339 @@ def create_app(test_config=None):
             abort(400)
 
         category = data.get('quiz_category', None)
-        previous_questions = data.get('previous_questions', [])
+        previous_questions = data.get('previous_questions', None) or []
+        count = data.get('count', None)
 
         # if there are no value associated to 'quiz_category'
         if category is None:
             abort(400)
 
+        # count is optional: without it, one question is returned,
+        # as the quiz view originally expected.
+        if count is not None and (isinstance(count, bool) or
+                                  not isinstance(count, int) or
+                                  not 0 < count <= MAX_QUIZ_COUNT):
+            abort(400)
+
+        # previous questions are sent as ids or as questions.
         try:
-            if category['id'] != 0:
-                list_questions = Question.query. \
-                                 filter(Question.category == category['id']). \
-                                 all()
-            else:
-                list_questions = Question.query.all()
+            previous_ids = [int(q['id']) if isinstance(q, dict) else int(q)
+                            for q in previous_questions]
+        except (KeyError, TypeError, ValueError):
+            abort(400)
+
+        # the questions are drawn at random by the database,
+        # without the previous ones, in a single query.
+        try:
+            list_questions = store.draw_questions(category['id'],
+                                                  previous_ids,
+                                                  count or 1)
+            # nothing left to draw: tell an exhausted category
+            # from an empty one.
+            has_questions = bool(list_questions) or \
+                store.quiz_has_questions(category['id'])
         except Exception as e:
             print(e)
             abort(404)
 
         # In case the list of question is empty.
-        if not list_questions:
+        if not has_questions:
             abort(404)
 
-        # To randomize our list.
-        # Not required since the order of results
-        # returned change for every query.
-        # But this adds a level of randomness.
-        random.shuffle(list_questions)
-
-        for q in list_questions:
-            if q.id not in previous_questions:
-                # the front end is taking care of
-                # updating the previous_questions array.
-                return jsonify({
-                    'question': q.format(),
-                    'quiz_category': q.category,
-                    'success': True
-                })
-
-        # return None if all the questions of the category have been sent out.
-        return jsonify({
+        response = {
             'question': None,
             'quiz_category': category['id'],
             'success': True
+        }
+
+        # the front end is taking care of
+        # updating the previous_questions array.
+        if list_questions:
+            response['question'] = list_questions[0].format()
+            response['quiz_category'] = list_questions[0].category
+
+        if count is not None:
+            response['questions'] = [q.format() for q in list_questions]
+
+        return jsonify(response)
+
+    '''
+    Live quiz rooms.
+    The host draws each question once on the server and it is pushed
+    to every player of the room over Server-Sent Events. Only the host,
+    who holds the host token returned on creation, can draw questions.
+    Players post their answers in batches; they are scored when the
+    next question is drawn. Messages go through the broker, so a room
+    can be shared by several workers when a Redis broker is configured.
+    '''
+
+    def format_event(message):
+        return 'event: {}\ndata: {}\n\n'.format(
+            message['event'], json.dumps(message['data']))
+
+    def public_question(question):
+        # the answer is only revealed with the results.
+        return {key: value for key, value in question.items()
+                if key != 'answer'}
+
+    def is_correct_answer(guess, answer):
+        # same rule as the quiz view of the frontend.
+        guess = re.sub(r'[.,\/#!$%\^&\*;:{}=\-_`~()]', '', guess).lower()
+        return all(word in guess for word in answer.lower().split(' '))
+
+    def get_room_or_404(room_id):
+        room = broker.get_state(room_id)
+        if room is None:
+            abort(404)
+        return room
+
+    def score_answers(room, answers):
+        # only the first answer of each player counts.
+        question = room['question']
+        players = set()
+        correct_players = []
+        for answer in answers:
+            if answer.get('question_id') != question['id'] or \
+               answer['player'] in players:
+                continue
+            players.add(answer['player'])
+            if is_correct_answer(str(answer.get('answer', '')),
+                                 question['answer']):
+                correct_players.append(answer.get('player'))
+
+        return {
+            'question_id': question['id'],
+            'answer': question['answer'],
+            'total_answers': len(players),
+            'correct_answers': len(correct_players),
+            'correct_players': correct_players
+        }
+
+    @app.route('/rooms', methods=['POST'])
+    def create_room():
+        data = request.get_json()
+
+        if not isinstance(data, dict):
+            abort(400)
+
+        category = data.get('quiz_category', None)
+
+        if not isinstance(category, dict) or \
+           isinstance(category.get('id', None), bool) or \
+           not isinstance(category.get('id', None), int):
+            abort(400)
+
+        room_id = uuid.uuid4().hex
+        host_token = uuid.uuid4().hex
+        broker.set_state(room_id, {
+            'quiz_category': category['id'],
+            'previous_questions': [],
+            'question': None,
+            'host_token': host_token
+        })
+
+        return jsonify({
+            'success': True,
+            'room_id': room_id,
+            'host_token': host_token,
+            'quiz_category': category['id']
+        })
+
+    @app.route('/rooms/<room_id>/stream')
+    def stream_room(room_id):
+        # subscribe before reading the room, so that a question
+        # drawn in between is either in the room or received.
+        subscription = broker.subscribe(room_id)
+        room = broker.get_state(room_id)
+        if room is None:
+            subscription.close()
+            abort(404)
+
+        def events():
+            try:
+                # sent right away: opens the stream for clients and
+                # proxies, and sets the reconnection delay.
+                yield 'retry: 3000\n\n'
+                if room['question'] is not None:
+                    yield format_event({
+                        'event': 'question',
+                        'data': public_question(room['question'])
+                    })
+                while True:
+                    message = subscription.get(
+                        timeout=ROOM_HEARTBEAT_SECONDS)
+                    if message is None:
+                        yield ': keepalive\n\n'
+                        continue
+                    yield format_event(message)
+                    if message['event'] == 'end':
+                        return
+            finally:
+                subscription.close()
+
+        response = Response(events(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache',
+                                     'X-Accel-Buffering': 'no'})
+        # also unsubscribes a stream that is closed before it started.
+        response.call_on_close(subscription.close)
+        return response
+
+    @app.route('/rooms/<room_id>/next', methods=['POST'])
+    def next_room_question(room_id):
+        data = request.get_json()
+
+        if not isinstance(data, dict) or \
+           not isinstance(data.get('host_token', None), str):
+            abort(400)
+
+        # one draw at a time per room: concurrent draws would
+        # publish two questions or lose a previous question.
+        try:
+            with broker.lock(room_id):
+                return draw_room_question(room_id, data['host_token'])
+        except BrokerLockTimeout as e:
+            print(e)
+            abort(422)
+
+    def draw_room_question(room_id, host_token):
+        room = get_room_or_404(room_id)
+
+        if not hmac.compare_digest(host_token.encode(),
+                                   room['host_token'].encode()):
+            abort(403)
+
+        if room['question'] is not None:
+            results = score_answers(room, broker.pop_answers(room_id))
+            broker.publish(room_id, {'event': 'results', 'data': results})
+
+        try:
+            next_question = next(iter(store.draw_questions(
+                room['quiz_category'], room['previous_questions'], 1)), None)
+        except Exception as e:
+            print(e)
+            abort(422)
+
+        if next_question is None:
+            room['question'] = None
+            broker.set_state(room_id, room)
+            players = broker.publish(room_id, {
+                'event': 'end',
+                'data': {'total_questions': len(room['previous_questions'])}
+            })
+            return jsonify({
+                'success': True,
+                'question': None,
+                'players': players
+            })
+
+        room['question'] = next_question.format()
+        room['previous_questions'].append(next_question.id)
+        broker.set_state(room_id, room)
+
+        players = broker.publish(room_id, {
+            'event': 'question',
+            'data': public_question(room['question'])
+        })
+
+        return jsonify({
+            'success': True,
+            'question': room['question'],
+            'players': players
+        })
+
+    @app.route('/rooms/<room_id>/answers', methods=['POST'])
+    def post_room_answers(room_id):
+        data = request.get_json()
+
+        if not isinstance(data, dict):
+            abort(400)
+
+        answers = data.get('answers', None)
+
+        if not isinstance(answers, list) or \
+           not 0 < len(answers) <= MAX_ANSWERS_PER_BATCH or \
+           not all(isinstance(answer, dict) and
+                   isinstance(answer.get('player', None), str)
+                   for answer in answers):
+            abort(400)
+
+        get_room_or_404(room_id)
+        broker.push_answers(room_id, answers)
+
+        return jsonify({
+            'success': True,
+            'received': len(answers)
+        })
+
+    def sub_request_method(sub_request):
+        return str(sub_request.get('method', 'GET')).upper()
+
+    def sub_request_endpoint(sub_request):
+        # resolved through the URL map as the sub-request will be,
+        # whatever the encoding, query string or fragment of its path.
+        with app.test_request_context(sub_request['path'],
+                                      method=sub_request_method(sub_request)):
+            rule = request.url_rule
+        return None if rule is None else rule.endpoint
+
+    '''
+    Run several requests against the routes above in one round trip.
+    Sub-requests share this request's app context, and so its
+    database session; each gets its own status and body.
+    '''
+    @app.route('/batch', methods=['POST'])
+    def batch_requests():
+        data = request.get_json()
+
+        if data is None:
+            abort(400)
+
+        sub_requests = data.get('requests', None)
+
+        if not isinstance(sub_requests, list) or \
+           not 0 < len(sub_requests) <= MAX_BATCH_REQUESTS:
+            abort(400)
+
+        for sub_request in sub_requests:
+            if not isinstance(sub_request, dict):
+                abort(400)
+            path = sub_request.get('path', None)
+            if not isinstance(path, str) or not path.startswith('/') or \
+               sub_request_endpoint(sub_request) == 'batch_requests':
+                abort(400)
+
+        responses = []
+        for sub_request in sub_requests:
+            method = sub_request_method(sub_request)
+            with app.test_request_context(sub_request['path'],
+                                          method=method,
+                                          json=sub_request.get('body',
+                                                               None)):
+                try:
+                    response = app.full_dispatch_request()
+                except Exception as e:
+                    print(e)
+                    if not snapshot_path:
+                        db.session.rollback()
+                    responses.append({'status': 500, 'body': None})
+                    continue
+
+            try:
+                # only JSON bodies can be embedded: streams, such as
+                # the room streams, are rejected.
+                if response.is_streamed or not response.is_json:
+                    responses.append({'status': 400, 'body': None})
+                else:
+                    responses.append({
+                        'status': response.status_code,
+                        'body': response.get_json()
+                    })
+            finally:
+                response.close()
+
+        return jsonify({
+            'success': True,
+            'responses': responses
         })
 
     '''
@@ -346,6 +974,14 @@ def create_app(test_config=None):
             'message': 'invalid request'
         }), 400
 
+    @app.errorhandler(403)
+    def forbidden(error):
+        return jsonify({
+            'success': False,
+            'error': 403,
+            'message': 'forbidden'
+        }), 403
+
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({
@@ -362,4 +998,12 @@ def create_app(test_config=None):
             'message': 'unable to be processed'
         }), 422
 
+    @app.errorhandler(503)
+    def unavailable(error):
+        return jsonify({
+            'success': False,
+            'error': 503,
+            'message': 'unavailable in read-only mode'
+        }), 503
+
     return app
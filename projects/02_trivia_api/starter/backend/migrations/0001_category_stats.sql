@@ -0,0 +1,19 @@
+--
+-- Summary table of question counts per category and difficulty.
+-- Maintained by Question.insert/delete in models.py.
+--
+
+CREATE TABLE IF NOT EXISTS public.category_stats (
+    category integer NOT NULL,
+    difficulty integer NOT NULL,
+    count integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (category, difficulty)
+);
+
+TRUNCATE public.category_stats;
+
+INSERT INTO public.category_stats (category, difficulty, count)
+SELECT category, difficulty, count(id)
+FROM public.questions
+WHERE category IS NOT NULL AND difficulty IS NOT NULL
+GROUP BY category, difficulty;
@@ -0,0 +1,31 @@
+--
+-- Change versions of questions and tombstones of deleted questions,
+-- read by GET /questions/changes.
+--
+
+CREATE SEQUENCE IF NOT EXISTS public.question_version_seq;
+
+ALTER TABLE public.questions ADD COLUMN IF NOT EXISTS version bigint;
+
+UPDATE public.questions
+SET version = numbered.version
+FROM (
+    SELECT id, nextval('public.question_version_seq') AS version
+    FROM (SELECT id FROM public.questions ORDER BY id) AS ordered
+) AS numbered
+WHERE questions.id = numbered.id AND questions.version IS NULL;
+
+ALTER TABLE public.questions
+    ALTER COLUMN version SET DEFAULT nextval('public.question_version_seq'),
+    ALTER COLUMN version SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS ix_questions_version
+    ON public.questions (version);
+
+CREATE TABLE IF NOT EXISTS public.question_tombstones (
+    question_id integer PRIMARY KEY,
+    version bigint NOT NULL DEFAULT nextval('public.question_version_seq')
+);
+
+CREATE INDEX IF NOT EXISTS ix_question_tombstones_version
+    ON public.question_tombstones (version);
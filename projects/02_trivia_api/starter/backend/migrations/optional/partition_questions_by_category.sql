@@ -0,0 +1,79 @@
+--
+-- Optional: list partitioning of questions by category, for very
+-- large banks. Queries filtered on a category then only read the
+-- partition of that category (partition pruning).
+-- Apply after the numbered migrations, on PostgreSQL 11 or later:
+--   psql trivia < migrations/optional/partition_questions_by_category.sql
+--
+-- A partitioned table needs the category in its primary key, so the
+-- category of a question becomes required, and deleting a category
+-- that still has questions is refused instead of clearing their
+-- category.
+--
+
+BEGIN;
+
+ALTER TABLE public.questions RENAME TO questions_unpartitioned;
+ALTER TABLE public.questions_unpartitioned
+    RENAME CONSTRAINT questions_pkey TO questions_unpartitioned_pkey;
+ALTER INDEX IF EXISTS public.ix_questions_version
+    RENAME TO ix_questions_unpartitioned_version;
+
+CREATE TABLE public.questions (
+    id integer NOT NULL DEFAULT nextval('public.questions_id_seq'::regclass),
+    question text,
+    answer text,
+    difficulty integer,
+    category integer NOT NULL,
+    version bigint NOT NULL DEFAULT nextval('public.question_version_seq'),
+    CONSTRAINT questions_pkey PRIMARY KEY (id, category),
+    CONSTRAINT category FOREIGN KEY (category)
+        REFERENCES public.categories(id) ON UPDATE CASCADE
+) PARTITION BY LIST (category);
+
+CREATE INDEX ix_questions_version ON public.questions (version);
+
+--
+-- create_questions_partition(category_id)
+--     creates the partition of a category, if it does not exist.
+--
+
+CREATE FUNCTION public.create_questions_partition(category_id integer)
+RETURNS void AS $$
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS public.%I '
+                   'PARTITION OF public.questions FOR VALUES IN (%s)',
+                   'questions_c' || category_id, category_id);
+END;
+$$ LANGUAGE plpgsql;
+
+-- questions of a category created without a partition land here.
+CREATE TABLE public.questions_default
+    PARTITION OF public.questions DEFAULT;
+
+SELECT public.create_questions_partition(id) FROM public.categories;
+
+-- every new category gets its own partition.
+CREATE FUNCTION public.create_category_partition() RETURNS trigger AS $$
+BEGIN
+    PERFORM public.create_questions_partition(NEW.id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER categories_create_partition
+    AFTER INSERT ON public.categories
+    FOR EACH ROW EXECUTE FUNCTION public.create_category_partition();
+
+INSERT INTO public.questions (id, question, answer, difficulty, category,
+                              version)
+SELECT id, question, answer, difficulty, category, version
+FROM public.questions_unpartitioned;
+
+-- keep the id sequence when the old table is dropped.
+ALTER SEQUENCE public.questions_id_seq OWNED BY NONE;
+DROP TABLE public.questions_unpartitioned;
+
+ANALYZE public.questions;
+
+COMMIT;
@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, BigInteger, Sequence, \
+  cast, create_engine, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -8,6 +10,19 @@ database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
 db = SQLAlchemy()
 
+# shared by questions and question_tombstones: every write gets a
+# version greater than all the previous ones.
+question_version_seq = Sequence('question_version_seq')
+
+# advisory lock held by question writes until they commit, so that
+# versions are committed in the order they are drawn: a client that
+# has read a version never misses a smaller one committed later.
+QUESTION_VERSION_LOCK = 7364021
+
+def lock_question_versions():
+    db.session.execute(select([func.pg_advisory_xact_lock(
+        QUESTION_VERSION_LOCK)]))
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -29,8 +44,11 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer)
   difficulty = Column(Integer)
+  version = Column(BigInteger, question_version_seq,
+                   onupdate=question_version_seq.next_value(),
+                   nullable=False, index=True)
 
   def __init__(self, question, answer, category, difficulty):
     self.question = question
@@ -39,14 +57,39 @@ class Question(db.Model):
     self.difficulty = difficulty
 
   def insert(self):
+    lock_question_versions()
     db.session.add(self)
+    CategoryStat.increment(self.category, self.difficulty, 1)
     db.session.commit()
   
+  # update and delete find the row by id and category, so that they
+  # only touch the partition of the category when questions is
+  # partitioned (see migrations/optional). The category may be NULL
+  # on the default schema: == None is rendered as IS NULL.
   def update(self):
+    lock_question_versions()
+    state = inspect(self)
+    values = {attr.key: attr.value for attr in state.attrs
+              if attr.history.has_changes()}
+    if values:
+      # the category the row had when it was loaded.
+      category = state.attrs.category.history.deleted or [self.category]
+      db.session.execute(Question.__table__.update().
+                         where(Question.id == self.id).
+                         where(Question.category == category[0]).
+                         values(version=question_version_seq.next_value(),
+                                **values))
+      db.session.expire(self)
     db.session.commit()
 
   def delete(self):
-    db.session.delete(self)
+    lock_question_versions()
+    db.session.execute(Question.__table__.delete().
+                       where(Question.id == self.id).
+                       where(Question.category == self.category))
+    db.session.expunge(self)
+    db.session.add(QuestionTombstone(self.id))
+    CategoryStat.increment(self.category, self.difficulty, -1)
     db.session.commit()
 
   def format(self):
@@ -58,6 +101,21 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+'''
+QuestionTombstone
+    left by Question.delete so that the change feed can report
+    deleted questions
+'''
+class QuestionTombstone(db.Model):
+  __tablename__ = 'question_tombstones'
+
+  question_id = Column(Integer, primary_key=True)
+  version = Column(BigInteger, question_version_seq,
+                   nullable=False, index=True)
+
+  def __init__(self, question_id):
+    self.question_id = question_id
+
 '''
 Category
 
@@ -75,4 +133,52 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+CategoryStat
+    number of questions per (category, difficulty), kept in step
+    with Question.insert/delete so stats never scan the questions table
+'''
+class CategoryStat(db.Model):
+  __tablename__ = 'category_stats'
+
+  category = Column(Integer, primary_key=True)
+  difficulty = Column(Integer, primary_key=True)
+  count = Column(Integer, nullable=False, default=0)
+
+  @classmethod
+  def increment(cls, category, difficulty, delta):
+    # single upsert so concurrent writers never lose an update.
+    # Runs in the caller's transaction and is committed with it.
+    # Questions without a category or difficulty are not counted,
+    # as in rebuild().
+    if category is None or difficulty is None:
+      return
+    table = cls.__table__
+    statement = pg_insert(table).values(category=int(category),
+                                        difficulty=int(difficulty),
+                                        count=delta)
+    statement = statement.on_conflict_do_update(
+      index_elements=[table.c.category, table.c.difficulty],
+      set_={'count': table.c.count + delta})
+    db.session.execute(statement)
+
+  @classmethod
+  def rebuild(cls):
+    cls.query.delete()
+    db.session.execute(cls.__table__.insert().from_select(
+      ['category', 'difficulty', 'count'],
+      db.session.query(cast(Question.category, Integer), Question.difficulty,
+                       func.count(Question.id)).
+      filter(Question.category.isnot(None),
+             Question.difficulty.isnot(None)).
+      group_by(Question.category, Question.difficulty)))
+    db.session.commit()
+
+  def format(self):
+    return {
+      'category': self.category,
+      'difficulty': self.difficulty,
+      'count': self.count
+    }
@@ -0,0 +1,124 @@
+from sqlalchemy import bindparam, func
+from sqlalchemy.ext import baked
+
+from models import db, Question, QuestionTombstone, Category, CategoryStat
+
+'''
+Queries of the hot request paths, as baked queries.
+The query built by each lambda chain and its compiled SQL are cached
+by the bakery the first time it runs; afterwards a call only binds
+its parameters and executes. Values must therefore always be passed
+as bindparam() parameters, never captured by the lambdas.
+'''
+bakery = baked.bakery()
+
+
+def all_categories():
+    bq = bakery(lambda session: session.query(Category))
+    bq += lambda q: q.order_by(Category.id)
+    return bq(db.session()).all()
+
+
+def question_counts():
+    # {category id: number of questions}, from the summary table.
+    bq = bakery(lambda session: session.query(
+        CategoryStat.category, func.sum(CategoryStat.count)))
+    bq += lambda q: q.group_by(CategoryStat.category)
+    return dict(bq(db.session()).all())
+
+
+def count_questions():
+    bq = bakery(lambda session: session.query(func.count(Question.id)))
+    return bq(db.session()).scalar()
+
+
+def questions_page(page, per_page):
+    bq = bakery(lambda session: session.query(Question))
+    bq += lambda q: q.order_by(Question.id). \
+        limit(bindparam('limit')). \
+        offset(bindparam('offset'))
+    return bq(db.session()). \
+        params(limit=per_page, offset=(page - 1) * per_page). \
+        all()
+
+
+def question_by_id(question_id):
+    bq = bakery(lambda session: session.query(Question))
+    bq += lambda q: q.filter(Question.id == bindparam('question_id'))
+    return bq(db.session()).params(question_id=question_id).one_or_none()
+
+
+def questions_by_ids(question_ids):
+    bq = bakery(lambda session: session.query(Question))
+    bq += lambda q: q.filter(
+        Question.id.in_(bindparam('question_ids', expanding=True))). \
+        order_by(Question.id)
+    return bq(db.session()).params(question_ids=list(question_ids)).all()
+
+
+def questions_by_category(category_id):
+    bq = bakery(lambda session: session.query(Question))
+    bq += lambda q: q.filter(Question.category == bindparam('category')). \
+        order_by(Question.id)
+    return bq(db.session()).params(category=int(category_id)).all()
+
+
+def search_questions(search_term):
+    bq = bakery(lambda session: session.query(Question))
+    bq += lambda q: q.filter(Question.question.ilike(bindparam('term'))). \
+        order_by(Question.id)
+    return bq(db.session()).params(term='%{}%'.format(search_term)).all()
+
+
+'''
+Quiz categories: a category id, or 0 for all the questions.
+'''
+
+def quiz_has_questions(category_id):
+    bq = bakery(lambda session: session.query(Question.id))
+    params = {}
+    if str(category_id) != '0':
+        bq += lambda q: q.filter(Question.category == bindparam('category'))
+        params['category'] = int(category_id)
+    return bq(db.session()).params(**params).first() is not None
+
+
+'''
+draw_questions(category_id, excluded_ids, count)
+    up to count distinct random questions of the quiz category that
+    are not excluded, drawn by the database in one query.
+'''
+def draw_questions(category_id, excluded_ids, count):
+    bq = bakery(lambda session: session.query(Question))
+    bq += lambda q: q.filter(
+        ~Question.id.in_(bindparam('excluded_ids', expanding=True)))
+    params = {'excluded_ids': list(excluded_ids), 'count': count}
+    if str(category_id) != '0':
+        bq += lambda q: q.filter(Question.category == bindparam('category'))
+        params['category'] = int(category_id)
+    bq += lambda q: q.order_by(func.random()).limit(bindparam('count'))
+    return bq(db.session()).params(**params).all()
+
+
+'''
+question_changes(since, limit)
+    the questions written and the tombstones left after version since,
+    oldest first, up to limit of them, and whether more follow.
+'''
+def question_changes(since, limit):
+    # one row more than the page on each side tells
+    # whether another page follows.
+    bq = bakery(lambda session: session.query(Question))
+    bq += lambda q: q.filter(Question.version > bindparam('since')). \
+        order_by(Question.version). \
+        limit(bindparam('limit'))
+    questions = bq(db.session()).params(since=since, limit=limit + 1).all()
+
+    bq = bakery(lambda session: session.query(QuestionTombstone))
+    bq += lambda q: q.filter(QuestionTombstone.version > bindparam('since')). \
+        order_by(QuestionTombstone.version). \
+        limit(bindparam('limit'))
+    tombstones = bq(db.session()).params(since=since, limit=limit + 1).all()
+
+    changes = sorted(questions + tombstones, key=lambda change: change.version)
+    return changes[:limit], len(changes) > limit
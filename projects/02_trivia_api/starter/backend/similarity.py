@@ -0,0 +1,167 @@
+import random
+import re
+import struct
+import threading
+import zlib
+
+NUM_PERMUTATIONS = 16
+NUM_BANDS = 4
+DUPLICATE_THRESHOLD = 0.7
+
+# smallest prime above 2**32, the range of the crc32 token hashes.
+_PRIME = 4294967311
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+'''
+shingles(question, answer)
+    normalized set of tokens a question is compared on: lower case
+    words without punctuation; answer words are prefixed so that the
+    same question with another answer is not an exact match.
+'''
+def shingles(question, answer):
+    question_tokens = _PUNCTUATION.sub(' ', question or '').lower().split()
+    answer_tokens = _PUNCTUATION.sub(' ', answer or '').lower().split()
+    return set(question_tokens) | \
+        set('a:' + token for token in answer_tokens)
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+'''
+SimilarityIndex
+    MinHash signatures of the questions, split into LSH bands.
+    Questions sharing a band are candidate duplicates, so a lookup
+    costs NUM_BANDS dictionary reads whatever the size of the bank.
+    Candidates are only estimates: callers verify them with jaccard()
+    on the actual texts.
+'''
+class SimilarityIndex:
+
+    def __init__(self, num_permutations=NUM_PERMUTATIONS,
+                 num_bands=NUM_BANDS, seed=1):
+        if num_permutations % num_bands:
+            raise ValueError('num_permutations must be a multiple '
+                             'of num_bands')
+        generator = random.Random(seed)
+        self._permutations = [
+            (generator.randrange(1, _PRIME), generator.randrange(0, _PRIME))
+            for _ in range(num_permutations)
+        ]
+        self._rows = num_permutations // num_bands
+        self._num_bands = num_bands
+        self._keys_format = '{}q'.format(num_bands)
+        self._lock = threading.Lock()
+        # band keys of each question, packed, to remove it later.
+        self._keys = {}
+        self._buckets = [{} for _ in range(num_bands)]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, question_id):
+        return question_id in self._keys
+
+    def signature(self, question, answer):
+        hashes = [zlib.crc32(token.encode())
+                  for token in shingles(question, answer)] or [0]
+        permutations = self._permutations
+        # one row per token, then the minimum of each column.
+        return tuple(map(min, zip(*[[(a * h + b) % _PRIME
+                                     for a, b in permutations]
+                                    for h in hashes])))
+
+    def _band_keys(self, signature):
+        rows = self._rows
+        return [hash(signature[band * rows:(band + 1) * rows])
+                for band in range(self._num_bands)]
+
+    def add(self, question_id, question, answer):
+        keys = self._band_keys(self.signature(question, answer))
+        with self._lock:
+            if question_id in self._keys:
+                self._remove(question_id)
+            self._keys[question_id] = struct.pack(self._keys_format, *keys)
+            for buckets, key in zip(self._buckets, keys):
+                # most buckets hold a single question: store it
+                # without a set to keep large indexes small.
+                members = buckets.get(key)
+                if members is None:
+                    buckets[key] = question_id
+                elif isinstance(members, set):
+                    members.add(question_id)
+                else:
+                    buckets[key] = {members, question_id}
+
+    def remove(self, question_id):
+        with self._lock:
+            self._remove(question_id)
+
+    def _remove(self, question_id):
+        keys = self._keys.pop(question_id, None)
+        if keys is None:
+            return
+        for buckets, key in zip(self._buckets,
+                                struct.unpack(self._keys_format, keys)):
+            members = buckets.get(key)
+            if isinstance(members, set):
+                members.discard(question_id)
+                if len(members) == 1:
+                    buckets[key] = members.pop()
+            elif members == question_id:
+                del buckets[key]
+
+    def candidates(self, question, answer):
+        keys = self._band_keys(self.signature(question, answer))
+        found = set()
+        with self._lock:
+            for buckets, key in zip(self._buckets, keys):
+                members = buckets.get(key)
+                if isinstance(members, set):
+                    found.update(members)
+                elif members is not None:
+                    found.add(members)
+        return found
+
+    def candidate_pairs(self):
+        pairs = set()
+        with self._lock:
+            for buckets in self._buckets:
+                for members in buckets.values():
+                    if isinstance(members, set):
+                        members = sorted(members)
+                        for i, first in enumerate(members):
+                            for second in members[i + 1:]:
+                                pairs.add((first, second))
+        return pairs
+
+
+'''
+group_duplicates(pairs)
+    merges verified duplicate pairs into groups of ids, so that
+    A~B and B~C are reported as one group [A, B, C].
+'''
+def group_duplicates(pairs):
+    parents = {}
+
+    def find(question_id):
+        parents.setdefault(question_id, question_id)
+        while parents[question_id] != question_id:
+            parents[question_id] = parents[parents[question_id]]
+            question_id = parents[question_id]
+        return question_id
+
+    for first, second in pairs:
+        root_first, root_second = find(first), find(second)
+        if root_first != root_second:
+            parents[max(root_first, root_second)] = \
+                min(root_first, root_second)
+
+    groups = {}
+    for question_id in parents:
+        groups.setdefault(find(question_id), []).append(question_id)
+
+    return sorted(sorted(group) for group in groups.values())
@@ -0,0 +1,308 @@
+import mmap
+import os
+import random
+import struct
+import sys
+
+from models import Question, Category
+
+'''
+Read-only snapshot of the question bank.
+
+File layout, little-endian:
+    header      HEADER
+    categories  one CATEGORY per category, by id
+    questions   one QUESTION per question, by id
+    positions   uint32 indexes into questions, grouped by category
+                (the slice of a category is given by its CATEGORY)
+    strings     UTF-8 texts, referenced by offset and length
+
+The file is memory-mapped read-only: records are read in place and
+texts are only decoded when a question is formatted. Worker processes
+mapping the same file share its pages through the page cache.
+'''
+MAGIC = b'TRIVSNAP'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<8sIIIQQQQQ')
+CATEGORY = struct.Struct('<iQIII')
+QUESTION = struct.Struct('<iiiQIQI')
+POSITION = struct.Struct('<I')
+
+NULL_INT = -2 ** 31
+NULL_LENGTH = 2 ** 32 - 1
+
+# positions can be read in place as native unsigned ints.
+NATIVE_POSITIONS = sys.byteorder == 'little' and \
+    struct.calcsize('I') == POSITION.size
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _nullable(value):
+    return NULL_INT if value is None else value
+
+
+def _from_nullable(value):
+    return None if value == NULL_INT else value
+
+
+'''
+export_snapshot(path)
+    writes the categories and questions of the database to a snapshot
+    file. Runs in an application context bound to the database.
+    Returns the number of questions exported.
+'''
+def export_snapshot(path, chunk_size=10000):
+    strings = bytearray()
+
+    def add_string(text):
+        if text is None:
+            return 0, NULL_LENGTH
+        encoded = text.encode('utf-8')
+        offset = len(strings)
+        strings.extend(encoded)
+        return offset, len(encoded)
+
+    questions = bytearray()
+    positions = {}
+    data_version = 0
+    question_count = 0
+    rows = Question.query.order_by(Question.id).yield_per(chunk_size)
+    for question in rows:
+        questions.extend(QUESTION.pack(
+            question.id,
+            _nullable(question.category),
+            _nullable(question.difficulty),
+            *add_string(question.question),
+            *add_string(question.answer)))
+        positions.setdefault(question.category, []).append(question_count)
+        data_version = max(data_version, question.version or 0)
+        question_count += 1
+
+    categories = bytearray()
+    category_positions = bytearray()
+    category_count = 0
+    for category in Category.query.order_by(Category.id).all():
+        members = positions.get(category.id, [])
+        categories.extend(CATEGORY.pack(
+            category.id,
+            *add_string(category.type),
+            len(category_positions) // POSITION.size,
+            len(members)))
+        for position in members:
+            category_positions.extend(POSITION.pack(position))
+        category_count += 1
+
+    categories_offset = HEADER.size
+    questions_offset = categories_offset + len(categories)
+    positions_offset = questions_offset + len(questions)
+    strings_offset = positions_offset + len(category_positions)
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as snapshot_file:
+        snapshot_file.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, category_count, question_count,
+            data_version, categories_offset, questions_offset,
+            positions_offset, strings_offset))
+        snapshot_file.write(categories)
+        snapshot_file.write(questions)
+        snapshot_file.write(category_positions)
+        snapshot_file.write(strings)
+    # readers never see a partly written snapshot.
+    os.replace(temporary_path, path)
+
+    return question_count
+
+
+class SnapshotCategory:
+    __slots__ = ('id', 'type')
+
+    def __init__(self, id, type):
+        self.id = id
+        self.type = type
+
+    def format(self):
+        return {
+            'id': self.id,
+            'type': self.type
+        }
+
+
+class SnapshotQuestion:
+    __slots__ = ('_store', 'id', 'category', 'difficulty',
+                 '_question', '_answer')
+
+    def __init__(self, store, record):
+        (self.id, category, difficulty, question_offset, question_length,
+         answer_offset, answer_length) = record
+        self._store = store
+        self.category = _from_nullable(category)
+        self.difficulty = _from_nullable(difficulty)
+        self._question = (question_offset, question_length)
+        self._answer = (answer_offset, answer_length)
+
+    @property
+    def question(self):
+        return self._store.string(*self._question)
+
+    @property
+    def answer(self):
+        return self._store.string(*self._answer)
+
+    def format(self):
+        return {
+            'id': self.id,
+            'question': self.question,
+            'answer': self.answer,
+            'category': self.category,
+            'difficulty': self.difficulty
+        }
+
+
+'''
+SnapshotStore
+    serves the read queries of queries.py from a snapshot file, with
+    the same functions, so that routes can use either of them.
+'''
+class SnapshotStore:
+
+    def __init__(self, path):
+        with open(path, 'rb') as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        if len(self._view) < HEADER.size:
+            raise SnapshotError('{} is not a snapshot'.format(path))
+        (magic, format_version, category_count, self._question_count,
+         self.data_version, categories_offset, self._questions_offset,
+         self._positions_offset,
+         self._strings_offset) = HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            raise SnapshotError('{} is not a snapshot'.format(path))
+        if format_version != FORMAT_VERSION:
+            raise SnapshotError('unsupported snapshot version {}'.format(
+                format_version))
+
+        # categories are few: they are decoded once.
+        self._categories = []
+        self._category_positions = {}
+        for index in range(category_count):
+            (category_id, type_offset, type_length, positions_start,
+             positions_count) = CATEGORY.unpack_from(
+                self._view, categories_offset + index * CATEGORY.size)
+            self._categories.append(SnapshotCategory(
+                category_id, self.string(type_offset, type_length)))
+            self._category_positions[category_id] = (positions_start,
+                                                     positions_count)
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+    def string(self, offset, length):
+        if length == NULL_LENGTH:
+            return None
+        start = self._strings_offset + offset
+        return str(self._view[start:start + length], 'utf-8')
+
+    def _question_at(self, index):
+        return SnapshotQuestion(self, QUESTION.unpack_from(
+            self._view, self._questions_offset + index * QUESTION.size))
+
+    def _question_id_at(self, index):
+        return struct.unpack_from(
+            '<i', self._view,
+            self._questions_offset + index * QUESTION.size)[0]
+
+    def _positions(self, category_id):
+        # indexes of the questions of a category, without copy.
+        start, count = self._category_positions.get(category_id, (0, 0))
+        offset = self._positions_offset + start * POSITION.size
+        if NATIVE_POSITIONS:
+            return self._view[offset:offset + count * POSITION.size]. \
+                cast('I')
+        return [POSITION.unpack_from(self._view,
+                                     offset + i * POSITION.size)[0]
+                for i in range(count)]
+
+    def _quiz_positions(self, category_id):
+        if str(category_id) == '0':
+            return range(self._question_count)
+        return self._positions(int(category_id))
+
+    def all_categories(self):
+        return list(self._categories)
+
+    def question_counts(self):
+        return {category_id: count for category_id, (_, count)
+                in self._category_positions.items()}
+
+    def count_questions(self):
+        return self._question_count
+
+    def questions_page(self, page, per_page):
+        start = (page - 1) * per_page
+        return [self._question_at(index) for index in
+                range(max(start, 0), min(start + per_page,
+                                         self._question_count))]
+
+    def question_by_id(self, question_id):
+        # questions are stored by id: binary search.
+        low, high = 0, self._question_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._question_id_at(middle) < question_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._question_count and \
+           self._question_id_at(low) == question_id:
+            return self._question_at(low)
+        return None
+
+    def questions_by_ids(self, question_ids):
+        questions = (self.question_by_id(question_id)
+                     for question_id in sorted(set(question_ids)))
+        return [question for question in questions if question is not None]
+
+    def questions_by_category(self, category_id):
+        return [self._question_at(index)
+                for index in self._positions(int(category_id))]
+
+    def search_questions(self, search_term):
+        search_term = search_term.lower()
+        questions = (self._question_at(index)
+                     for index in range(self._question_count))
+        return [question for question in questions
+                if search_term in (question.question or '').lower()]
+
+    def quiz_has_questions(self, category_id):
+        return len(self._quiz_positions(category_id)) > 0
+
+    def draw_questions(self, category_id, excluded_ids, count):
+        positions = self._quiz_positions(category_id)
+        excluded_ids = set(excluded_ids)
+
+        # small pools are filtered; large ones are sampled at random
+        # until enough questions that are not excluded are found.
+        if len(positions) <= 4 * (count + len(excluded_ids)):
+            questions = [self._question_at(index) for index in positions]
+            questions = [question for question in questions
+                         if question.id not in excluded_ids]
+            return random.sample(questions, min(count, len(questions)))
+
+        drawn = []
+        seen = set()
+        while len(drawn) < count:
+            index = positions[random.randrange(len(positions))]
+            if index in seen:
+                continue
+            seen.add(index)
+            question = self._question_at(index)
+            if question.id not in excluded_ids:
+                drawn.append(question)
+        return drawn
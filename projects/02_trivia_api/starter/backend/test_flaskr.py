@@ -1,10 +1,21 @@
 import os
+import shutil
+import tempfile
 import unittest
 import json
+import threading
+import time
+from unittest import mock
+import fakeredis
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from broker import InProcessBroker, RedisBroker, BrokerLockTimeout
+from models import setup_db, db, Question, Category, \
+    QUESTION_VERSION_LOCK
+from snapshot import SnapshotStore, SnapshotCategory, SnapshotError, \
+    export_snapshot
 
 from dotenv import load_dotenv
 
@@ -14,13 +25,165 @@ DB_NAME = os.getenv('DB_NAME')
 
 DB_PATH = "postgres://{}/{}".format(DB_HOST, DB_NAME)
 
-class TriviaTestCase(unittest.TestCase):
+class RoomTestMixin:
+    """Live quiz rooms, run with each broker"""
+
+    def create_room(self, category_id):
+        res = self.client().post('/rooms',
+                                 json={'quiz_category': {'id': category_id}})
+        data = json.loads(res.data)
+        return data['room_id'], data['host_token']
+
+    def next_room_question(self, room_id, host_token):
+        return self.client().post('/rooms/' + room_id + '/next',
+                                  json={'host_token': host_token})
+
+    def read_event(self, stream):
+        for chunk in stream.response:
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith('event: '):
+                lines = chunk.strip().split('\n')
+                return lines[0][len('event: '):], \
+                    json.loads(lines[1][len('data: '):])
+
+    def test_create_room(self):
+        res = self.client().post('/rooms', json={'quiz_category': {'id': 4}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['room_id'])
+        self.assertTrue(data['host_token'])
+        self.assertEqual(data['quiz_category'], 4)
+
+    def test_400_create_room_without_category(self):
+        res = self.client().post('/rooms', json={})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'invalid request')
+
+        for category in [4, 'xid', {'id': 'abc'}, {'id': True}]:
+            res = self.client().post('/rooms',
+                                     json={'quiz_category': category})
+            self.assertEqual(res.status_code, 400)
+
+    def test_400_room_requests_that_are_not_objects(self):
+        room_id, host_token = self.create_room(4)
+
+        for path in ['/rooms', '/rooms/' + room_id + '/next',
+                     '/rooms/' + room_id + '/answers']:
+            res = self.client().post(path, json=[host_token])
+            self.assertEqual(res.status_code, 400)
+
+    def test_room_broadcasts_question_and_results(self):
+        room_id, host_token = self.create_room(4)
+        stream = self.client().get('/rooms/' + room_id + '/stream',
+                                   buffered=False)
+
+        res = self.next_room_question(room_id, host_token)
+        data = json.loads(res.data)
+        question = data['question']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['players'], 1)
+        self.assertEqual(question['category'], 4)
+
+        event, payload = self.read_event(stream)
+        self.assertEqual(event, 'question')
+        self.assertEqual(payload['id'], question['id'])
+        self.assertNotIn('answer', payload)
+
+        res = self.client().post('/rooms/' + room_id + '/answers', json={
+            'answers': [
+                {'player': 'a', 'question_id': question['id'],
+                 'answer': question['answer']},
+                {'player': 'b', 'question_id': question['id'],
+                 'answer': 'no idea'}
+            ]})
+        self.assertEqual(json.loads(res.data)['received'], 2)
+
+        self.next_room_question(room_id, host_token)
+
+        event, payload = self.read_event(stream)
+        self.assertEqual(event, 'results')
+        self.assertEqual(payload['question_id'], question['id'])
+        self.assertEqual(payload['total_answers'], 2)
+        self.assertEqual(payload['correct_players'], ['a'])
+        stream.close()
+
+    def test_room_counts_first_answer_of_each_player(self):
+        room_id, host_token = self.create_room(4)
+        question = json.loads(
+            self.next_room_question(room_id, host_token).data)['question']
+        stream = self.client().get('/rooms/' + room_id + '/stream',
+                                   buffered=False)
+
+        self.client().post('/rooms/' + room_id + '/answers', json={
+            'answers': [
+                {'player': 'a', 'question_id': question['id'],
+                 'answer': question['answer']},
+                {'player': 'a', 'question_id': question['id'],
+                 'answer': question['answer']},
+                {'player': 'b', 'question_id': question['id'],
+                 'answer': 'no idea'},
+                {'player': 'b', 'question_id': question['id'],
+                 'answer': question['answer']}
+            ]})
+        self.next_room_question(room_id, host_token)
+
+        # the current question is sent first on connection.
+        self.read_event(stream)
+        event, payload = self.read_event(stream)
+        self.assertEqual(event, 'results')
+        self.assertEqual(payload['total_answers'], 2)
+        self.assertEqual(payload['correct_players'], ['a'])
+        stream.close()
+
+    def test_403_next_room_question_without_host_token(self):
+        room_id, host_token = self.create_room(4)
+
+        res = self.next_room_question(room_id, 'not' + host_token)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'forbidden')
+
+        res = self.client().post('/rooms/' + room_id + '/next', json={})
+        self.assertEqual(res.status_code, 400)
+
+    def test_room_ends_when_category_is_exhausted(self):
+        room_id, host_token = self.create_room(7)
+
+        res = self.next_room_question(room_id, host_token)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertFalse(data['question'])
+
+    def test_404_room_does_not_exist(self):
+        res = self.client().post('/rooms/unknown/answers',
+                                 json={'answers': [{'player': 'a'}]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+        res = self.client().get('/rooms/unknown/stream')
+        self.assertEqual(res.status_code, 404)
+
+
+class TriviaTestCase(RoomTestMixin, unittest.TestCase):
     """This class represents the trivia test case"""
 
     # setUp is run before every test method.
     def setUp(self):
         """Define test variables and initialize app.""" 
-        self.app = create_app()
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': DB_PATH})
         self.client = self.app.test_client
         #self.database_name = "trivia_test"
         self.database_name = DB_NAME
@@ -69,6 +232,39 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
 
+    def test_get_categories_with_counts(self):
+        res = self.client().get('/categories?with_counts=true')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['question_counts'])
+        self.assertEqual(set(data['question_counts']),
+                         set(data['categories']))
+
+    def test_get_category_stats(self):
+        res = self.client().get('/categories/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['stats'])
+        self.assertEqual(data['total_questions'],
+                         sum(cat['total'] for cat in data['stats'].values()))
+        self.assertEqual(data['stats']['4']['total'],
+                         sum(data['stats']['4']['difficulties'].values()))
+
+    def test_category_stats_follow_insert(self):
+        before = json.loads(self.client().get('/categories/stats').data)
+        self.client().post('/questions', json=self.new_question)
+        after = json.loads(self.client().get('/categories/stats').data)
+
+        self.assertEqual(after['stats']['4']['difficulties']['3'],
+                         before['stats'].get('4', {}).
+                         get('difficulties', {}).get('3', 0) + 1)
+        self.assertEqual(after['total_questions'],
+                         before['total_questions'] + 1)
+
     def test_post_new_question(self):
         res = self.client().post('/questions', json=self.new_question)
         data = json.loads(res.data)
@@ -78,6 +274,78 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_number_questions'])
         self.assertEqual(data['success'], True)
 
+    def test_409_post_near_duplicate_question(self):
+        res = self.client().post('/questions', json={
+            'question': "What boxer's original name was Cassius Clay?",
+            'answer': 'Muhammad Ali',
+            'category': 4,
+            'difficulty': 1,
+            'reject_duplicates': True
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'duplicate question')
+        self.assertEqual(data['duplicates'][0]['id'], 9)
+
+    def test_get_duplicate_questions(self):
+        question = {
+            'question': 'Which planet is known as the red planet?',
+            'answer': 'Mars',
+            'category': 1,
+            'difficulty': 1
+        }
+        first = json.loads(self.client().post('/questions',
+                                              json=question).data)
+        question['question'] = 'Which planet is known as the Red Planet'
+        second = json.loads(self.client().post('/questions',
+                                               json=question).data)
+
+        self.assertIn(first['created'],
+                      [d['id'] for d in second['possible_duplicates']])
+
+        res = self.client().get('/questions/duplicates')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['total_groups'])
+        self.assertTrue(any(
+            set([first['created'], second['created']]) <=
+            set(q['id'] for q in group) for group in data['groups']))
+
+    def test_duplicates_written_by_another_process(self):
+        # two apps stand for two workers, each with its own index.
+        other_client = create_app(
+            {'SQLALCHEMY_DATABASE_URI': DB_PATH}).test_client
+        question = {
+            'question': 'Which ocean is the largest on Earth?',
+            'answer': 'Pacific',
+            'category': 3,
+            'difficulty': 1
+        }
+        # builds this index before the other app writes.
+        self.client().get('/questions/duplicates')
+        created = json.loads(other_client().post('/questions',
+                                                 json=question).data)['created']
+
+        question['reject_duplicates'] = True
+        res = self.client().post('/questions', json=question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 409)
+        self.assertIn(created, [d['id'] for d in data['duplicates']])
+
+        other_client().delete('/questions/' + str(created))
+        res = self.client().post('/questions', json=question)
+        data = json.loads(res.data)
+
+        self.assertNotIn(created,
+                         [d['id'] for d in data.get('duplicates', [])])
+        if res.status_code == 200:
+            self.client().delete('/questions/' + str(data['created']))
+
     def test_422_post_error_incomplete_question(self):
         # defining incomplete question to send to endpoint 
         self.incomplete_question = {
@@ -128,6 +396,82 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'resource not found')
         self.assertFalse(data['success'])
 
+    def test_get_questions_by_ids(self):
+        res = self.client().get('/questions?ids=2,4,1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([q['id'] for q in data['questions']], [2, 4])
+        self.assertEqual(data['total_questions'], 2)
+        self.assertEqual(data['missing'], [1000])
+
+    def test_404_get_questions_by_ids_not_found(self):
+        res = self.client().get('/questions?ids=1000,1001')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+    def test_400_get_questions_by_invalid_ids(self):
+        res = self.client().get('/questions?ids=2,four')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'invalid request')
+
+    def test_batch_requests(self):
+        res = self.client().post('/batch', json={'requests': [
+            {'path': '/categories'},
+            {'path': '/questions?page=1000'},
+            {'method': 'POST', 'path': '/quizzes',
+             'body': {'quiz_category': {'id': 0}, 'previous_questions': []}}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([r['status'] for r in data['responses']],
+                         [200, 404, 200])
+        self.assertTrue(data['responses'][0]['body']['categories'])
+        self.assertEqual(data['responses'][1]['body']['message'],
+                         'resource not found')
+        self.assertTrue(data['responses'][2]['body']['question'])
+
+    def test_400_batch_requests_nested_batch(self):
+        res = self.client().post('/batch', json={'requests': [
+            {'method': 'POST', 'path': '/batch', 'body': {'requests': []}}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'invalid request')
+
+        for path in ['/batch#x', '/%62atch', '/batch?x=1']:
+            res = self.client().post('/batch', json={'requests': [
+                {'method': 'POST', 'path': path,
+                 'body': {'requests': [{'path': '/categories'}]}}
+            ]})
+            self.assertEqual(res.status_code, 400)
+
+    def test_batch_requests_reject_streams(self):
+        room_id, host_token = self.create_room(4)
+
+        res = self.client().post('/batch', json={'requests': [
+            {'path': '/rooms/' + room_id + '/stream'}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['responses'], [{'status': 400, 'body': None}])
+
+        # the stream was closed, so nobody listens to the room.
+        res = self.next_room_question(room_id, host_token)
+        self.assertEqual(json.loads(res.data)['players'], 0)
+
     def test_get_questions_by_category(self):
         res = self.client().get('/categories/4/questions')
         data = json.loads(res.data)
@@ -154,6 +498,85 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
 
+    def latest_version(self):
+        since, has_more = 0, True
+        while has_more:
+            data = json.loads(self.client().get(
+                '/questions/changes?limit=1000&since=' + str(since)).data)
+            since, has_more = data['next_since'], data['has_more']
+        return since
+
+    def test_get_question_changes(self):
+        res = self.client().get('/questions/changes?since=0&limit=5')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['changes']), 5)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(data['next_since'], data['changes'][-1]['version'])
+
+        res = self.client().get('/questions/changes?since=' +
+                                str(data['next_since']))
+        next_data = json.loads(res.data)
+
+        self.assertTrue(all(change['version'] > data['next_since']
+                            for change in next_data['changes']))
+
+    def test_question_changes_record_insert_and_delete(self):
+        since = self.latest_version()
+        created = json.loads(self.client().post(
+            '/questions', json=self.new_question).data)['created']
+
+        res = self.client().get('/questions/changes?since=' + str(since))
+        data = json.loads(res.data)
+
+        self.assertEqual(len(data['changes']), 1)
+        self.assertEqual(data['changes'][0]['type'], 'upsert')
+        self.assertEqual(data['changes'][0]['question']['id'], created)
+
+        self.client().delete('/questions/' + str(created))
+
+        res = self.client().get('/questions/changes?since=' + str(since))
+        data = json.loads(res.data)
+
+        self.assertEqual(len(data['changes']), 1)
+        self.assertEqual(data['changes'][0]['type'], 'delete')
+        self.assertEqual(data['changes'][0]['id'], created)
+        self.assertFalse(data['has_more'])
+
+    def test_question_writes_wait_for_the_version_lock(self):
+        since = self.latest_version()
+        responses = []
+        writer = threading.Thread(target=lambda: responses.append(
+            self.client().post('/questions', json=self.new_question)))
+
+        # another writer holds the lock until it commits.
+        connection = create_engine(DB_PATH).connect()
+        transaction = connection.begin()
+        connection.execute('SELECT pg_advisory_xact_lock(%s)',
+                           (QUESTION_VERSION_LOCK,))
+        writer.start()
+        writer.join(0.5)
+        self.assertTrue(writer.is_alive())
+        transaction.commit()
+        connection.close()
+        writer.join()
+
+        created = json.loads(responses[0].data)['created']
+        res = self.client().get('/questions/changes?since=' + str(since))
+        data = json.loads(res.data)
+        self.assertEqual([change['question']['id']
+                          for change in data['changes']], [created])
+
+    def test_400_question_changes_invalid_limit(self):
+        res = self.client().get('/questions/changes?limit=0')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'invalid request')
+
     def test_delete_question(self):
         question_id = 16
 
@@ -164,6 +587,53 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['deleted'], question_id)
         self.assertTrue(data['total_number_questions'])
 
+    def add_question_row(self, category, difficulty):
+        '''Adds a question as trivia.psql allows, NULLs included.'''
+        with self.app.app_context():
+            question = Question('Placeholder question?', 'Placeholder',
+                                category, difficulty)
+            question.insert()
+            return question.id
+
+    def test_delete_question_without_difficulty(self):
+        question_id = self.add_question_row(4, None)
+
+        res = self.client().delete('/questions/' + str(question_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], question_id)
+
+    def test_delete_question_without_category(self):
+        # categories are required once questions is partitioned.
+        with self.app.app_context():
+            partitioned = db.engine.execute(
+                "SELECT count(*) FROM pg_partitioned_table "
+                "WHERE partrelid = 'public.questions'::regclass").scalar()
+        if partitioned:
+            self.skipTest('questions is partitioned')
+        question_id = self.add_question_row(None, 2)
+
+        res = self.client().delete('/questions/' + str(question_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], question_id)
+
+    def test_update_question(self):
+        question_id = self.add_question_row(4, 2)
+
+        with self.app.app_context():
+            question = Question.query.get(question_id)
+            version = question.version
+            question.answer = 'Another answer'
+            question.update()
+            question = Question.query.get(question_id)
+
+            self.assertEqual(question.answer, 'Another answer')
+            self.assertGreater(question.version, version)
+            question.delete()
+
     def test_404_delete_question_does_not_exist(self):
         question_id = 1000
 
@@ -226,6 +696,65 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['question'])
 
+    def test_get_several_quiz_questions(self):
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 4},
+            'previous_questions': [5, 9],
+            'count': 3
+        })
+        data = json.loads(res.data)
+        ids = [q['id'] for q in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(len(set(ids)), 3)
+        self.assertFalse(set(ids) & set([5, 9]))
+        self.assertTrue(all(q['category'] == 4 for q in data['questions']))
+        self.assertEqual(data['question'], data['questions'][0])
+
+    def test_quiz_count_larger_than_what_is_left(self):
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 0},
+            'previous_questions': [],
+            'count': 50
+        })
+        data = json.loads(res.data)
+        ids = [q['id'] for q in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(ids), len(set(ids)))
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 0},
+            'previous_questions': ids,
+            'count': 5
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], [])
+        self.assertFalse(data['question'])
+
+    def test_400_quiz_invalid_count(self):
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 4},
+            'previous_questions': [],
+            'count': 0
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'invalid request')
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 4},
+            'previous_questions': [],
+            'count': True
+        })
+        self.assertEqual(res.status_code, 400)
+
     def test_get_random_question_for_quizz_without_category(self):
         res = self.client().post('/quizzes', json={'previous_questions':[1,2,3,4,5,6]})
         data = json.loads(res.data)
@@ -260,6 +789,227 @@ class TriviaTestCase(unittest.TestCase):
         self.assertFalse(data['question'])
         self.assertEqual(data['quiz_category'], '4')
 
+    def scanned_tables(self, call, statement_type='SELECT'):
+        '''Tables read by the statements of a type that call() runs.'''
+        statements = []
+        thread = threading.get_ident()
+
+        # the background build of the duplicate index is not counted.
+        def capture(conn, cursor, statement, parameters, context, many):
+            if statement.lstrip().upper().startswith(statement_type) and \
+               threading.get_ident() == thread:
+                statements.append((statement, parameters))
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                call()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+
+            tables = set()
+            for statement, parameters in statements:
+                plan = db.engine.execute('EXPLAIN (FORMAT JSON) ' + statement,
+                                         parameters).scalar()
+                nodes = [plan[0]['Plan']]
+                while nodes:
+                    node = nodes.pop()
+                    if 'Relation Name' in node:
+                        tables.add(node['Relation Name'])
+                    nodes.extend(node.get('Plans', []))
+            return tables
+
+    def skip_unless_partitioned(self):
+        with self.app.app_context():
+            partitioned = db.engine.execute(
+                "SELECT count(*) FROM pg_partitioned_table "
+                "WHERE partrelid = 'public.questions'::regclass").scalar()
+        if not partitioned:
+            self.skipTest('questions is not partitioned')
+
+    def test_category_questions_read_only_their_partition(self):
+        self.skip_unless_partitioned()
+        tables = self.scanned_tables(
+            lambda: self.client().get('/categories/4/questions'))
+
+        self.assertIn('questions_c4', tables)
+        self.assertFalse(any(table.startswith('questions_') and
+                             table != 'questions_c4' for table in tables))
+
+    def test_quiz_draw_reads_only_its_partition(self):
+        self.skip_unless_partitioned()
+        tables = self.scanned_tables(lambda: self.client().post(
+            '/quizzes', json={'quiz_category': {'id': 3},
+                              'previous_questions': [13]}))
+
+        self.assertIn('questions_c3', tables)
+        self.assertFalse(any(table.startswith('questions_') and
+                             table != 'questions_c3' for table in tables))
+
+    def test_delete_question_touches_only_its_partition(self):
+        self.skip_unless_partitioned()
+        question_id = self.add_question_row(2, 1)
+        tables = self.scanned_tables(
+            lambda: self.client().delete('/questions/' + str(question_id)),
+            'DELETE')
+
+        self.assertIn('questions_c2', tables)
+        self.assertFalse(any(table.startswith('questions_') and
+                             table != 'questions_c2' for table in tables))
+
+    def test_all_categories_quiz_reads_every_partition(self):
+        self.skip_unless_partitioned()
+        tables = self.scanned_tables(lambda: self.client().post(
+            '/quizzes', json={'quiz_category': {'id': 0},
+                              'previous_questions': []}))
+
+        self.assertTrue({'questions_c1', 'questions_c6'} <= tables)
+
+class RedisRoomTestCase(RoomTestMixin, unittest.TestCase):
+    """Live quiz rooms shared through Redis, here a fakeredis server"""
+
+    def setUp(self):
+        with mock.patch('redis.Redis.from_url',
+                        return_value=fakeredis.FakeRedis()):
+            self.app = create_app({'QUIZ_BROKER_URL': 'redis://localhost',
+                                   'SQLALCHEMY_DATABASE_URI': DB_PATH})
+        self.client = self.app.test_client
+
+
+class BrokerTestCase(unittest.TestCase):
+    """Room state and locks of the brokers"""
+
+    def test_in_process_broker_drops_expired_rooms(self):
+        broker = InProcessBroker(ttl_seconds=0.01)
+        broker.set_state('old', {'question': None})
+        broker.push_answers('old', [{'player': 'a'}])
+        time.sleep(0.02)
+        broker.set_state('new', {'question': None})
+
+        self.assertIsNone(broker.get_state('old'))
+        self.assertEqual(broker.pop_answers('old'), [])
+        self.assertEqual(broker.get_state('new'), {'question': None})
+
+    def test_broker_lock_is_exclusive(self):
+        with mock.patch('redis.Redis.from_url',
+                        return_value=fakeredis.FakeRedis()):
+            redis_broker = RedisBroker('redis://localhost')
+
+        for broker in [InProcessBroker(), redis_broker]:
+            with broker.lock('room'):
+                with self.assertRaises(BrokerLockTimeout):
+                    with broker.lock('room', timeout=0.05):
+                        pass
+            with broker.lock('room', timeout=0.05):
+                pass
+
+
+class SnapshotTestCase(unittest.TestCase):
+    """Read-only mode, served from a snapshot of the test database"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.directory, 'trivia.snap')
+
+        self.db_app = create_app({'SQLALCHEMY_DATABASE_URI': DB_PATH})
+        with self.db_app.app_context():
+            export_snapshot(self.snapshot_path)
+        self.db_client = self.db_app.test_client
+
+        self.app = create_app({'QUESTION_BANK_SNAPSHOT': self.snapshot_path})
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameResponse(self, path):
+        res = self.client().get(path)
+        db_res = self.db_client().get(path)
+
+        self.assertEqual(res.status_code, db_res.status_code)
+        self.assertEqual(json.loads(res.data), json.loads(db_res.data))
+
+    def test_snapshot_get_categories(self):
+        self.assertSameResponse('/categories')
+        self.assertSameResponse('/categories?with_counts=true')
+
+    def test_snapshot_get_questions(self):
+        self.assertSameResponse('/questions?page=1')
+        self.assertSameResponse('/questions?page=2')
+        self.assertSameResponse('/questions?page=1000')
+
+    def test_snapshot_get_questions_by_ids(self):
+        self.assertSameResponse('/questions?ids=2,4,1000')
+
+    def test_snapshot_get_questions_by_category(self):
+        self.assertSameResponse('/categories/4/questions')
+        self.assertSameResponse('/categories/40/questions')
+
+    def test_snapshot_search_questions(self):
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'title'})
+        db_res = self.db_client().post('/questions/search',
+                                       json={'searchTerm': 'title'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), json.loads(db_res.data))
+
+    def test_snapshot_quiz(self):
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 4},
+            'previous_questions': [5, 9],
+            'count': 3
+        })
+        data = json.loads(res.data)
+        ids = [q['id'] for q in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(set(ids)), 3)
+        self.assertFalse(set(ids) & set([5, 9]))
+        self.assertTrue(all(q['category'] == 4 for q in data['questions']))
+
+        res = self.client().post('/quizzes',
+                                 json={'quiz_category': {'id': '7'}})
+        self.assertEqual(res.status_code, 404)
+
+    def test_503_snapshot_writes(self):
+        res = self.client().post('/questions', json={
+            'question': 'Who is a little puppy',
+            'answer': 'Romeo',
+            'category': 4,
+            'difficulty': 3
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'unavailable in read-only mode')
+
+        res = self.client().delete('/questions/2')
+        self.assertEqual(res.status_code, 503)
+
+    def test_snapshot_batch_requests(self):
+        # a sub-request that fails unexpectedly, not through abort().
+        with mock.patch.object(SnapshotCategory, 'format',
+                               side_effect=AttributeError):
+            res = self.client().post('/batch', json={'requests': [
+                {'path': '/categories'},
+                {'path': '/questions?ids=2'}
+            ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r['status'] for r in data['responses']],
+                         [500, 200])
+
+    def test_snapshot_rejects_other_files(self):
+        path = os.path.join(self.directory, 'not_a_snapshot')
+        with open(path, 'wb') as other_file:
+            other_file.write(b'x' * 100)
+
+        with self.assertRaises(SnapshotError):
+            SnapshotStore(path)
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -15,6 +15,7 @@ class QuizView extends Component {
         categories: {},
         numCorrect: 0,
         currentQuestion: {},
+        prefetchedQuestions: [],
         guess: '',
         forceEnd: false
     }
@@ -43,10 +44,29 @@ class QuizView extends Component {
     this.setState({[event.target.name]: event.target.value})
   }
 
+  showQuestion = (previousQuestions, question, prefetchedQuestions) => {
+    this.setState({
+      showAnswer: false,
+      previousQuestions: previousQuestions,
+      currentQuestion: question,
+      prefetchedQuestions: prefetchedQuestions,
+      guess: '',
+      forceEnd: question ? false : true
+    })
+  }
+
   getNextQuestion = () => {
     const previousQuestions = [...this.state.previousQuestions]
     if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
 
+    // the questions of the play are fetched together: the next one
+    // comes from that window when it is not empty.
+    if(this.state.prefetchedQuestions.length) {
+      const [question, ...prefetchedQuestions] = this.state.prefetchedQuestions
+      this.showQuestion(previousQuestions, question, prefetchedQuestions)
+      return;
+    }
+
     $.ajax({
       url: '/quizzes', //TODO: update request URL
       type: "POST",
@@ -54,20 +74,16 @@ class QuizView extends Component {
       contentType: 'application/json',
       data: JSON.stringify({
         previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory
+        quiz_category: this.state.quizCategory,
+        count: Math.max(questionsPerPlay - previousQuestions.length, 1)
       }),
       xhrFields: {
         withCredentials: true
       },
       crossDomain: true,
       success: (result) => {
-        this.setState({
-          showAnswer: false,
-          previousQuestions: previousQuestions,
-          currentQuestion: result.question,
-          guess: '',
-          forceEnd: result.question ? false : true
-        })
+        const [question = null, ...prefetchedQuestions] = result.questions
+        this.showQuestion(previousQuestions, question, prefetchedQuestions)
         return;
       },
       error: (error) => {
@@ -94,6 +110,7 @@ class QuizView extends Component {
       showAnswer: false,
       numCorrect: 0,
       currentQuestion: {},
+      prefetchedQuestions: [],
       guess: '',
       forceEnd: false
     })